@@ -1,98 +1,305 @@
+import contextlib
+import hashlib
+import json
 
 import torch
+from dataclasses import dataclass
+from pathlib import Path
 from PIL import Image
+from torchvision import transforms
+from torchvision.transforms import InterpolationMode
 from transformers import CLIPProcessor, CLIPModel
 from typing import List, Tuple
-from config import get_disease_labels
+from config import CLIP_ONNX_FILE, ensure_cache_dir, get_disease_labels, write_cache_file
+
+try:
+    import onnxruntime as ort
+except ImportError:  # type: ignore
+    ort = None  # type: ignore
+
+# Descriptions used to decide whether an image is wheat-related at all
+WHEAT_DESCRIPTIONS = [
+    "a photo of a wheat plant",
+    "a photo of wheat leaves",
+    "a photo of wheat leaf",
+    "a photo of wheat crop",
+    "a photo of wheat field",
+]
+
+NON_WHEAT_DESCRIPTIONS = [
+    "a photo of an animal",
+    "a photo of a pet",
+    "a photo of a cat",
+    "a photo of a dog",
+    "a photo of a person",
+    "a photo of food",
+    "a photo of a building",
+    "a photo of a car",
+    "a photo of nature without plants",
+]
+
+
+def disease_prompt(label: str) -> str:
+    """Text prompt CLIP compares the image against for a disease label."""
+    if label == "Healthy":
+        return "a photo of a healthy wheat leaf"
+    return f"a photo of wheat leaf with {label}"
+
+
+@dataclass
+class ClipResult:
+    is_wheat: bool
+    wheat_confidence: float
+    label: str
+    score: float
+    all_scores: List[Tuple[str, float]]
+
 
 class WheatDiseaseCLIP:
     """Wrapper around CLIP for wheat disease classification."""
 
-    def __init__(self, model_name: str = "openai/clip-vit-base-patch32", device: str | None = None):
+    def __init__(
+        self,
+        model_name: str = "openai/clip-vit-base-patch32",
+        device: str | None = None,
+        onnx_path: Path | None = CLIP_ONNX_FILE,
+        quantize: bool = False,
+    ):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = CLIPModel.from_pretrained(model_name).to(self.device)
+        self.model = CLIPModel.from_pretrained(model_name).to(self.device).eval()
         self.processor = CLIPProcessor.from_pretrained(model_name)
 
-    @torch.no_grad()
+        # Same resize/crop/normalize as CLIPImageProcessor, without its per-call
+        # overhead; the processor is only used to tokenize prompts.
+        image_processor = self.processor.image_processor
+        self.image_tf = transforms.Compose([
+            transforms.Resize(224, interpolation=InterpolationMode.BICUBIC),
+            transforms.CenterCrop(224),
+            transforms.ToTensor(),
+            transforms.Normalize(image_processor.image_mean, image_processor.image_std),
+        ])
+
+        # Use the exported ONNX image encoder when available (see export_clip_onnx.py)
+        self.ort_sess = self._load_onnx(onnx_path)
+
+        # Inference is memory-bandwidth bound: keep FP16 weights on GPU and run
+        # forwards under autocast (bf16 on CPU, where FP16 matmuls are slow).
+        # On CPU, `quantize` opts in to INT8 linear layers (the bulk of CLIP's weights).
+        self._device_type = torch.device(self.device).type
+        self._quantized = False
+        if self._device_type == "cuda":
+            self.model.half()
+            self._autocast_dtype = torch.float16
+        elif self.ort_sess is not None:
+            # The ONNX image encoder is FP32 and PyTorch only encodes the prompts
+            # (once, at startup): keep them FP32 too so both sides share a precision
+            self._autocast_dtype = None
+        else:
+            self._autocast_dtype = torch.bfloat16
+            if quantize:
+                try:
+                    self.model = torch.ao.quantization.quantize_dynamic(
+                        self.model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                    # Dynamically quantized layers expect FP32 activations
+                    self._autocast_dtype = None
+                    self._quantized = True
+                except Exception:
+                    # No quantized engine on this CPU: keep FP32 weights
+                    pass
+        self._image_features = self.model.get_image_features
+
+        # All prompts are static, so encode them once here and only run the
+        # image encoder per request.
+        self.disease_labels = get_disease_labels()
+        self.disease_prompts = [disease_prompt(label) for label in self.disease_labels]
+        n_wheat = len(WHEAT_DESCRIPTIONS)
+        n_gate = n_wheat + len(NON_WHEAT_DESCRIPTIONS)
+        text_emb = self._load_text_embeddings(
+            model_name, WHEAT_DESCRIPTIONS + NON_WHEAT_DESCRIPTIONS + self.disease_prompts
+        )
+        self.wheat_text_emb = text_emb[:n_wheat]
+        self.nonwheat_text_emb = text_emb[n_wheat:n_gate]
+        self.disease_text_emb = text_emb[n_gate:]
+        self._gate_text_emb = text_emb[:n_gate]
+        self._logit_scale = self.model.logit_scale.detach().exp().float()
+
+    @staticmethod
+    def _load_onnx(onnx_path: Path | None):
+        if ort is None or onnx_path is None or not onnx_path.exists():
+            return None
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "CPUExecutionProvider") if p in available]
+        return ort.InferenceSession(str(onnx_path), sess_options=options, providers=providers)
+
+    def _load_text_embeddings(self, model_name: str, texts: List[str]) -> torch.Tensor:
+        """Encode texts, reusing embeddings saved to disk by a previous run.
+
+        The cache key covers the model, precision and the ordered prompts, so
+        adding a disease label to the RDF invalidates it automatically.
+        """
+        cache_dir = ensure_cache_dir()
+        if cache_dir is None:
+            return self._encode_text(texts)
+        key_src = json.dumps(
+            [model_name, self._device_type, str(self._autocast_dtype), self._quantized, texts]
+        )
+        key = hashlib.sha256(key_src.encode("utf-8")).hexdigest()[:16]
+        cache_path = cache_dir / f"clip_text_emb_{key}.pt"
+
+        if cache_path.exists():
+            try:
+                # The file only holds a tensor; never unpickle arbitrary objects
+                return torch.load(cache_path, map_location=self.device, weights_only=True)
+            except Exception:
+                pass  # Corrupt or incompatible cache file: recompute below
+
+        text_emb = self._encode_text(texts)
+        try:
+            write_cache_file(cache_path, lambda f: torch.save(text_emb.cpu(), f))
+        except OSError:
+            pass
+        return text_emb
+
+    @torch.inference_mode()
+    def _encode_text(self, texts: List[str]) -> torch.Tensor:
+        """Return L2-normalized CLIP text embeddings, shape (len(texts), dim)."""
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True).to(self.device)
+        with self._autocast():
+            text_emb = self.model.get_text_features(**inputs)
+        return text_emb / text_emb.norm(dim=-1, keepdim=True)
+
+    @torch.inference_mode()
+    def _encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """Return L2-normalized CLIP image embeddings from one batched forward, shape (len(images), dim)."""
+        pixel_values = torch.stack([
+            self.image_tf(image if image.mode == "RGB" else image.convert("RGB")) for image in images
+        ])
+        if self.ort_sess is not None:
+            np_pixels = pixel_values.numpy()
+            image_emb = torch.from_numpy(self.ort_sess.run(None, {"pixel_values": np_pixels})[0])
+            image_emb = image_emb.to(self.device, dtype=self.disease_text_emb.dtype)
+        else:
+            pixel_values = pixel_values.to(self.device, dtype=self.model.dtype, non_blocking=True)
+            with self._autocast():
+                image_emb = self._image_features(pixel_values=pixel_values)
+        return image_emb / image_emb.norm(dim=-1, keepdim=True)
+
+    def compile(self, mode: str | None = "reduce-overhead") -> None:
+        """Compile the image encoder with torch.compile; mode=None restores eager execution.
+
+        The first forwards after compiling are slow, so call classify() once as warmup.
+        Has no effect when the ONNX image encoder is in use.
+        """
+        if mode is None:
+            self._image_features = self.model.get_image_features
+        else:
+            self._image_features = torch.compile(self.model.get_image_features, mode=mode, fullgraph=False)
+
+    def _autocast(self):
+        if self._autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type=self._device_type, dtype=self._autocast_dtype)
+
+    def _probs(self, image_emb: torch.Tensor, text_emb: torch.Tensor) -> torch.Tensor:
+        """Softmax over the texts per image, same scaling as CLIPModel's logits_per_image.
+
+        Stays on self.device; callers transfer only the values they need.
+        """
+        # Softmax in FP32 to avoid half-precision overflow/underflow
+        logits_per_image = (image_emb @ text_emb.T).float() * self._logit_scale
+        return logits_per_image.softmax(dim=1)
+
+    def _wheat_gate(self, image_emb: torch.Tensor, threshold: float) -> List[Tuple[bool, float]]:
+        probs = self._probs(image_emb, self._gate_text_emb)
+        n_wheat = len(WHEAT_DESCRIPTIONS)
+
+        # Get the maximum probability for wheat and non-wheat descriptions
+        # (reduced on device, then a single (batch, 2) transfer)
+        max_probs = torch.stack(
+            [probs[:, :n_wheat].max(dim=1).values, probs[:, n_wheat:].max(dim=1).values], dim=1
+        ).tolist()
+
+        # Consider it wheat if wheat probability is significantly higher
+        return [
+            (max_wheat_prob > threshold and max_wheat_prob > max_non_wheat_prob, max_wheat_prob)
+            for max_wheat_prob, max_non_wheat_prob in max_probs
+        ]
+
+    def _score_labels(
+        self, image_emb: torch.Tensor, labels: List[str], text_emb: torch.Tensor
+    ) -> List[Tuple[str, float, List[Tuple[str, float]]]]:
+        probs = self._probs(image_emb, text_emb)
+
+        # Sort on device; one transfer of the ordered scores and indices
+        top_values, top_indices = torch.topk(probs, k=probs.shape[1], dim=1)
+        results = []
+        for indices, values in zip(top_indices.tolist(), top_values.tolist()):
+            scored = [(labels[i], v) for i, v in zip(indices, values)]
+            best_label, best_score = scored[0]
+            results.append((best_label, best_score, scored))
+        return results
+
+    @torch.inference_mode()
+    def classify(
+        self, images: Image.Image | List[Image.Image], threshold: float = 0.3
+    ) -> ClipResult | List[ClipResult]:
+        """Run the wheat check and disease classification off shared image embeddings.
+
+        A list of images (e.g. test-time augmentation crops) is encoded in one
+        batched forward and gives one result per image.
+
+        Args:
+            images: Input image, or list of images
+            threshold: Minimum confidence threshold to consider image as wheat-related
+        """
+        single = isinstance(images, Image.Image)
+        batch = [images] if single else list(images)
+        if not batch:
+            return []
+
+        image_emb = self._encode_images(batch)
+        gates = self._wheat_gate(image_emb, threshold)
+        scores = self._score_labels(image_emb, self.disease_labels, self.disease_text_emb)
+        results = [
+            ClipResult(
+                is_wheat=is_wheat,
+                wheat_confidence=wheat_confidence,
+                label=label,
+                score=score,
+                all_scores=all_scores,
+            )
+            for (is_wheat, wheat_confidence), (label, score, all_scores) in zip(gates, scores)
+        ]
+        return results[0] if single else results
+
+    @torch.inference_mode()
     def is_wheat_image(self, image: Image.Image, threshold: float = 0.3) -> Tuple[bool, float]:
         """Check if the image is wheat-related before disease classification.
-        
+
         Args:
             image: Input image
             threshold: Minimum confidence threshold to consider image as wheat-related
-            
+
         Returns:
             (is_wheat, confidence_score)
         """
-        # Compare against wheat and non-wheat descriptions
-        wheat_descriptions = [
-            "a photo of a wheat plant",
-            "a photo of wheat leaves",
-            "a photo of wheat leaf",
-            "a photo of wheat crop",
-            "a photo of wheat field",
-        ]
-        
-        non_wheat_descriptions = [
-            "a photo of an animal",
-            "a photo of a pet",
-            "a photo of a cat",
-            "a photo of a dog",
-            "a photo of a person",
-            "a photo of food",
-            "a photo of a building",
-            "a photo of a car",
-            "a photo of nature without plants",
-        ]
-        
-        all_descriptions = wheat_descriptions + non_wheat_descriptions
-        
-        inputs = self.processor(
-            text=all_descriptions,
-            images=image,
-            return_tensors="pt",
-            padding=True,
-        ).to(self.device)
-
-        outputs = self.model(**inputs)
-        logits_per_image = outputs.logits_per_image  # shape: (1, num_descriptions)
-        probs = logits_per_image.softmax(dim=1).cpu().numpy()[0]
-        
-        # Get the maximum probability for wheat descriptions
-        wheat_probs = probs[:len(wheat_descriptions)]
-        max_wheat_prob = float(wheat_probs.max())
-        
-        # Get the maximum probability for non-wheat descriptions
-        non_wheat_probs = probs[len(wheat_descriptions):]
-        max_non_wheat_prob = float(non_wheat_probs.max())
-        
-        # Consider it wheat if wheat probability is significantly higher
-        is_wheat = max_wheat_prob > threshold and max_wheat_prob > max_non_wheat_prob
-        confidence = max_wheat_prob
-        
-        return is_wheat, confidence
+        return self._wheat_gate(self._encode_images([image]), threshold)[0]
 
-    @torch.no_grad()
+    @torch.inference_mode()
     def predict(self, image: Image.Image, candidate_labels: List[str] | None = None) -> Tuple[str, float, List[Tuple[str, float]]]:
         """Classify an image into one of the candidate_labels using CLIP.
 
         Returns:
             best_label, best_score, all_scores_sorted
         """
-        labels = candidate_labels or get_disease_labels()
-
-        inputs = self.processor(
-            text=[f"a photo of wheat leaf with {label}" if label != "Healthy" else "a photo of a healthy wheat leaf" for label in labels],
-            images=image,
-            return_tensors="pt",
-            padding=True,
-        ).to(self.device)
-
-        outputs = self.model(**inputs)
-        logits_per_image = outputs.logits_per_image  # shape: (1, num_labels)
-        probs = logits_per_image.softmax(dim=1).cpu().numpy()[0]
-
-        scored = list(zip(labels, probs))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        best_label, best_score = scored[0]
-        return best_label, float(best_score), scored
+        if candidate_labels and candidate_labels != self.disease_labels:
+            labels = candidate_labels
+            text_emb = self._encode_text([disease_prompt(label) for label in labels])
+        else:
+            labels = self.disease_labels
+            text_emb = self.disease_text_emb
+
+        return self._score_labels(self._encode_images([image]), labels, text_emb)[0]
@@ -1,11 +1,58 @@
 
+import functools
+import os
+import stat
+import tempfile
 from pathlib import Path
+from typing import IO, Callable
 
 # Base paths
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 RDF_DIR = PROJECT_ROOT / "app" / "rdf"
 # Use the CIMMYT-derived RDF graph
 RDF_FILE = RDF_DIR / "cimmyt_wheat_diseases.ttl"
+# Optional ONNX export of the CLIP image encoder (created by export_clip_onnx.py)
+CLIP_ONNX_FILE = PROJECT_ROOT / "app" / "models" / "clip_vision.onnx"
+# Derived data that is safe to recompute (e.g. cached CLIP text embeddings).
+# Per-user: cache files are unpickled, so they must not be writable by others.
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "wheat_disease_detection"
+
+
+def ensure_cache_dir() -> Path | None:
+    """Create CACHE_DIR if needed and return it, or None if it is unsafe to use.
+
+    The directory must be a real directory owned by the current user that
+    nobody else can write to; otherwise callers skip caching.
+    """
+    try:
+        CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = CACHE_DIR.lstat()
+    except OSError:
+        return None
+    if not stat.S_ISDIR(st.st_mode) or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return None
+    if hasattr(os, "getuid") and st.st_uid != os.getuid():
+        return None
+    return CACHE_DIR
+
+
+def write_cache_file(path: Path, write: Callable[[IO[bytes]], None]) -> None:
+    """Atomically replace path with what write() puts into a binary file.
+
+    Data goes to a temporary file in the same directory that is renamed into
+    place, so concurrent readers never see a half-written cache file.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
 
 # Disease labels will be loaded dynamically from RDF
 # This list is a fallback if RDF loading fails
@@ -17,28 +64,24 @@ DISEASE_LABELS_FALLBACK = [
     "Powdery Mildew",
 ]
 
-# Disease labels will be loaded lazily to avoid circular imports
-DISEASE_LABELS = None
-
+@functools.lru_cache(maxsize=1)
 def get_disease_labels():
-    """Dynamically load all disease labels from RDF."""
-    global DISEASE_LABELS
-    if DISEASE_LABELS is not None:
-        return DISEASE_LABELS
-    
+    """Dynamically load all disease labels from RDF.
+
+    Cached after the first call; imported lazily to avoid circular imports.
+    lru_cache does not serialize first calls, so concurrent first callers may
+    each load the knowledge base; they get equal results either way.
+    """
     try:
         from rdf_knowledge import WheatKnowledgeBase
         kb = WheatKnowledgeBase()
         labels = kb.get_all_disease_labels()
         # Add "Healthy" as the first option
         if "Healthy" not in labels:
-            DISEASE_LABELS = ["Healthy"] + labels
-        else:
-            DISEASE_LABELS = labels
-        return DISEASE_LABELS
+            return ["Healthy"] + labels
+        return labels
     except Exception:
-        DISEASE_LABELS = DISEASE_LABELS_FALLBACK
-        return DISEASE_LABELS
+        return DISEASE_LABELS_FALLBACK
 
 # Default humidity value if user doesn't specify (used in reasoning demo)
 DEFAULT_HUMIDITY = 60  # percent
@@ -1,7 +1,11 @@
 
 from __future__ import annotations
 
+import functools
+import hashlib
 import os
+import threading
+from collections import OrderedDict
 from typing import Dict, Any
 
 import json
@@ -16,6 +20,17 @@ try:
 except ImportError:  # type: ignore
     Groq = None  # type: ignore
 
+# Which providers can be tried at all, resolved once at import
+_GROQ_AVAILABLE = Groq is not None and bool(os.getenv("GROQ_API_KEY"))
+_OPENAI_AVAILABLE = openai is not None and bool(os.getenv("OPENAI_API_KEY"))
+
+# LLM responses keyed by sha256 of the prompt; identical diagnoses skip the API call.
+# Bounded (least recently used entries evicted first) since the app is long-lived
+# and prompts vary with the CLIP confidence.
+_LLM_CACHE_SIZE = 256
+_LLM_CACHE: OrderedDict[str, str] = OrderedDict()
+_LLM_CACHE_LOCK = threading.Lock()
+
 
 def build_prompt(structured_result: Dict[str, Any]) -> str:
     """Create a prompt for the LLM from reasoning + RDF results."""
@@ -82,6 +97,12 @@ Format your response in clean markdown with clear sections. Be practical and far
     return base
 
 
+@functools.lru_cache(maxsize=1)
+def _groq_client(api_key: str):
+    """Shared Groq client so the HTTP connection is reused across calls."""
+    return Groq(api_key=api_key)
+
+
 def call_groq_chat(prompt: str) -> str:
     """Call Groq API for LLM responses."""
     if Groq is None:
@@ -90,8 +111,8 @@ def call_groq_chat(prompt: str) -> str:
     if not api_key:
         raise RuntimeError("GROQ_API_KEY is not set. Set it as an environment variable.")
     
-    client = Groq(api_key=api_key)
-    
+    client = _groq_client(api_key)
+
     response = client.chat.completions.create(
         model="llama-3.1-70b-versatile",
         messages=[
@@ -173,14 +194,32 @@ def template_fallback(structured_result: Dict[str, Any]) -> str:
 def generate_explanation(structured_result: Dict[str, Any]) -> str:
     """High-level wrapper: try Groq LLM first, then OpenAI, then template."""
     prompt = build_prompt(structured_result)
-    
-    # Try Groq first (preferred for treatments)
-    try:
-        return call_groq_chat(prompt)
-    except Exception as e:
-        # Try OpenAI as fallback
+    key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    with _LLM_CACHE_LOCK:
+        cached = _LLM_CACHE.get(key)
+        if cached is not None:
+            _LLM_CACHE.move_to_end(key)
+            return cached
+
+    # Try Groq first (preferred for treatments), then OpenAI; skip providers
+    # that are not installed or configured instead of raising and catching.
+    explanation = None
+    if _GROQ_AVAILABLE:
+        try:
+            explanation = call_groq_chat(prompt)
+        except Exception:
+            pass
+    if explanation is None and _OPENAI_AVAILABLE:
         try:
-            return call_openai_chat(prompt)
+            explanation = call_openai_chat(prompt)
         except Exception:
-            # Final fallback to template
-            return template_fallback(structured_result)
+            pass
+    if explanation is None:
+        # Final fallback to template (not cached, so a later LLM success replaces it)
+        return template_fallback(structured_result)
+
+    with _LLM_CACHE_LOCK:
+        _LLM_CACHE[key] = explanation
+        while len(_LLM_CACHE) > _LLM_CACHE_SIZE:
+            _LLM_CACHE.popitem(last=False)
+    return explanation
@@ -1,25 +1,42 @@
 
 import io
+import os
 from typing import Optional
 
 import streamlit as st
 from PIL import Image
 
 from clip_model import WheatDiseaseCLIP
-from rdf_knowledge import WheatKnowledgeBase
+from rdf_knowledge import WheatKnowledgeBase, knowledge_base_mtime
 from reasoner import WheatReasoner
 from nlp_symptom_extractor import extract_symptoms
 from llm_interface import generate_explanation
 
-
 @st.cache_resource
 def load_clip_model():
-    return WheatDiseaseCLIP()
-
-
-@st.cache_resource
-def load_kb_and_reasoner(cache_version: int = 2):
-    """Load knowledge base and reasoner. Cache version forces reload when changed."""
+    # Set CLIP_QUANTIZE=1 to run the CPU PyTorch model with INT8 linear layers
+    model = WheatDiseaseCLIP(quantize=os.getenv("CLIP_QUANTIZE") == "1")
+    # Set SKIP_WARMUP=1 during development to skip compiling and warming up
+    if os.getenv("SKIP_WARMUP"):
+        return model
+
+    model.compile("reduce-overhead")
+    warmup_image = Image.new("RGB", (224, 224), (128, 128, 128))
+    try:
+        # Pay compile + first-forward cost at startup instead of on the first diagnosis.
+        # A compiled model is slow for its first two forwards (profiling, then fusion).
+        for _ in range(2):
+            model.classify(warmup_image)
+    except Exception:
+        # torch.compile needs a working compiler toolchain; run eagerly without one
+        model.compile(None)
+        model.classify(warmup_image)
+    return model
+
+
+@st.cache_resource(max_entries=1)
+def load_kb_and_reasoner(kb_mtime: float):
+    """Load knowledge base and reasoner. Keyed on the RDF files' mtime so edits reload it."""
     kb = WheatKnowledgeBase()
     reasoner = WheatReasoner(kb)
     return kb, reasoner
@@ -29,7 +46,7 @@ def run_pipeline(
     image: Optional[Image.Image],
     symptom_text: str,
 ):
-    kb, reasoner = load_kb_and_reasoner()
+    kb, reasoner = load_kb_and_reasoner(knowledge_base_mtime())
     clip_model = load_clip_model()
 
     clip_label = "Healthy"
@@ -39,9 +56,10 @@ def run_pipeline(
     wheat_confidence = 0.0
 
     if image is not None:
-        # First, check if the image is wheat-related
-        is_wheat, wheat_confidence = clip_model.is_wheat_image(image)
-        
+        # One image forward serves both the wheat check and disease prediction
+        clip_result = clip_model.classify(image)
+        is_wheat, wheat_confidence = clip_result.is_wheat, clip_result.wheat_confidence
+
         if not is_wheat:
             # Return early with error flag if not wheat
             return {
@@ -50,8 +68,8 @@ def run_pipeline(
                 "message": "The uploaded image does not appear to be wheat-related. Please upload an image of wheat leaves or plants."
             }
         
-        # Only proceed with disease prediction if image is wheat-related
-        clip_label, clip_conf, all_scores = clip_model.predict(image)
+        # Only use the disease prediction if image is wheat-related
+        clip_label, clip_conf, all_scores = clip_result.label, clip_result.score, clip_result.all_scores
 
     text_symptoms = extract_symptoms(symptom_text)
 
@@ -127,7 +145,15 @@ def main():
         st.markdown("### 📷 Image Preview")
         pil_image = None
         if uploaded is not None:
-            pil_image = Image.open(uploaded).convert("RGB")
+            pil_image = Image.open(uploaded)
+            # Pillow resizes palette ("P") and bilevel images with NEAREST, so
+            # convert those (and other non-RGB/L modes) before downscaling
+            if pil_image.mode not in ("RGB", "L"):
+                pil_image = pil_image.convert("RGB")
+            # Downscale large phone photos before preview and CLIP preprocessing;
+            # thumbnail() preserves aspect and lets JPEGs decode at reduced size.
+            pil_image.thumbnail((512, 512), Image.BILINEAR)
+            pil_image = pil_image.convert("RGB")
             st.image(pil_image, use_container_width=True, caption="Uploaded image")
         else:
             st.info("👆 Please upload a wheat leaf image to begin diagnosis")
@@ -1,15 +1,66 @@
 
 from __future__ import annotations
 
+import pickle
+import sys
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
-from rdflib import Graph, Namespace, RDF, RDFS, Literal, URIRef
+from rdflib import BNode, Graph, Namespace, RDF, RDFS, Literal, URIRef
 
-from config import RDF_FILE
+from config import RDF_FILE, ensure_cache_dir, write_cache_file
+
+try:
+    import pyoxigraph
+except ImportError:  # type: ignore
+    pyoxigraph = None  # type: ignore
 
 WHEAT = Namespace("http://example.org/wheat#")
+_XSD_STRING = "http://www.w3.org/2001/XMLSchema#string"
+
+
+def additions_path(ttl_path: Path) -> Path:
+    """N-Triples file that update_rdf_with_treatments.py appends new triples to."""
+    return ttl_path.with_suffix(".additions.nt")
+
+
+def knowledge_base_mtime(ttl_path: Path = RDF_FILE) -> float:
+    """Latest modification time of the TTL file and its additions file."""
+    additions = additions_path(ttl_path)
+    additions_mtime = additions.stat().st_mtime if additions.exists() else 0.0
+    return max(ttl_path.stat().st_mtime, additions_mtime)
+
+
+def _from_oxigraph(term):
+    """Convert a pyoxigraph term to the equivalent rdflib term."""
+    if isinstance(term, pyoxigraph.NamedNode):
+        return URIRef(term.value)
+    if isinstance(term, pyoxigraph.BlankNode):
+        return BNode(term.value)
+    if term.language:
+        return Literal(term.value, lang=term.language)
+    datatype = term.datatype.value
+    # rdflib keeps plain literals untyped rather than xsd:string
+    return Literal(term.value, datatype=None if datatype == _XSD_STRING else URIRef(datatype))
+
+
+def _parse_rdf(graph: Graph, path: Path, fmt: str) -> None:
+    """Parse an RDF file into graph, using pyoxigraph's Rust parser when installed."""
+    if pyoxigraph is not None:
+        try:
+            # RdfFormat is new in pyoxigraph 0.4; older versions fall through to rdflib
+            ox_format = {"turtle": pyoxigraph.RdfFormat.TURTLE, "nt": pyoxigraph.RdfFormat.N_TRIPLES}[fmt]
+            triples = [
+                (_from_oxigraph(q.subject), _from_oxigraph(q.predicate), _from_oxigraph(q.object))
+                for q in pyoxigraph.parse(path=str(path), format=ox_format, base_iri=path.resolve().as_uri())
+            ]
+        except Exception:
+            pass  # Unsupported pyoxigraph version or parse error: let rdflib handle (and report) it
+        else:
+            graph.addN((s, p, o, graph) for s, p, o in triples)
+            return
+    graph.parse(path, format=fmt)
 
 
 @dataclass
@@ -26,80 +77,163 @@ class DiseaseFacts:
 
 
 class WheatKnowledgeBase:
+    # Bump when _build_indices() changes what the persisted indices contain
+    _INDEX_VERSION = 1
+    # Lookup tables built by _build_indices() and persisted between runs
+    _INDEX_ATTRS = (
+        "_disease_uris",
+        "_spo",
+        "_labels",
+        "_label_to_uri",
+        "_base_label_to_uri",
+        "_any_label_to_uri",
+        "_disease_label_list",
+        "_uri_to_labels",
+        "_disease_display_labels",
+        "_norm_cache",
+    )
+
     def __init__(self, ttl_path: Path | None = None):
         self.ttl_path = ttl_path or RDF_FILE
-        self.graph = Graph()
+        self._graph: Graph | None = None
+        self._facts_cache: Dict[str, DiseaseFacts | None] = {}
+        # id(facts) -> (facts, to_dict() result) for facts returned by get_disease_facts
+        self._facts_dict_cache: Dict[int, Tuple[DiseaseFacts, Dict[str, Any]]] = {}
         self._load()
 
+    @property
+    def graph(self) -> Graph:
+        """The RDF graph; parsed on first access when the indices came from the cache."""
+        if self._graph is None:
+            self._graph = Graph()
+            _parse_rdf(self._graph, self.ttl_path, "turtle")
+            additions = additions_path(self.ttl_path)
+            if additions.exists():
+                _parse_rdf(self._graph, additions, "nt")
+        return self._graph
+
     def _load(self):
         if not self.ttl_path.exists():
             raise FileNotFoundError(f"RDF file not found at {self.ttl_path}")
-        self.graph.parse(self.ttl_path, format="turtle")
 
-    def get_all_disease_labels(self) -> List[str]:
-        """Get all disease labels from the RDF graph, preferring shorter names."""
-        labels = []
-        seen_uris = set()
-        
-        for s, p, o in self.graph.triples((None, RDF.type, WHEAT.Disease)):
-            if s in seen_uris:
+        # Reuse the indices built by a previous process while the RDF files are
+        # unchanged; lookups never touch the graph, so parsing is skipped entirely
+        cache_dir = ensure_cache_dir()
+        if cache_dir is None:
+            self._build_indices()
+            return
+        mtimes = [self.ttl_path.stat().st_mtime_ns]
+        additions = additions_path(self.ttl_path)
+        if additions.exists():
+            mtimes.append(additions.stat().st_mtime_ns)
+        cache_prefix = f"kb_index_v{self._INDEX_VERSION}_{self.ttl_path.stem}_"
+        cache_path = cache_dir / f"{cache_prefix}{'_'.join(map(str, mtimes))}.pkl"
+        if cache_path.exists():
+            try:
+                with open(cache_path, "rb") as f:
+                    indices = pickle.load(f)
+                if set(indices) == set(self._INDEX_ATTRS):
+                    self.__dict__.update(indices)
+                    return
+            except Exception:
+                pass  # Corrupt or incompatible cache file: rebuild below
+
+        self._build_indices()
+        indices = {name: getattr(self, name) for name in self._INDEX_ATTRS}
+        try:
+            write_cache_file(cache_path, lambda f: pickle.dump(indices, f, protocol=5))
+        except OSError:
+            return
+        # Indices for older versions of these RDF files are never read again
+        for stale in cache_dir.glob(f"{cache_prefix}*.pkl"):
+            if stale != cache_path:
+                try:
+                    stale.unlink()
+                except OSError:
+                    pass
+
+    def _build_indices(self):
+        """Precompute label/type lookups; the graph is read-only after load."""
+        g = self.graph
+        self._disease_uris = frozenset(s for s, _, _ in g.triples((None, RDF.type, WHEAT.Disease)))
+
+        # subject -> predicate -> objects, in graph.triples((s, p, None)) order;
+        # hot-path fact lookups read this instead of querying rdflib
+        self._spo: Dict[URIRef, Dict[URIRef, List[Any]]] = {}
+        for s in g.subjects(unique=True):
+            po = self._spo[s] = {}
+            for _, p, o in g.triples((s, None, None)):
+                po.setdefault(p, []).append(o)
+
+        # First label of every labelled node (what graph.value(node, RDFS.label) returns)
+        self._labels: Dict[URIRef, Literal] = {
+            s: po[RDFS.label][0] for s, po in self._spo.items() if RDFS.label in po
+        }
+
+        # Normalized label -> URI, first match in graph order wins (as a linear scan would)
+        self._label_to_uri: Dict[str, URIRef] = {}
+        self._base_label_to_uri: Dict[str, URIRef] = {}
+        self._any_label_to_uri: Dict[str, URIRef] = {}
+        self._disease_label_list: List[Tuple[str, URIRef]] = []
+        # Normalized form of every label (diseases, symptoms, ...), computed once
+        self._norm_cache: Dict[str, str] = {}
+        for s, _, o in g.triples((None, RDFS.label, None)):
+            label = str(o)
+            label_lower = self._norm_cache.get(label)
+            if label_lower is None:
+                label_lower = self._norm_cache[label] = sys.intern(label.lower().strip())
+            self._any_label_to_uri.setdefault(label_lower, s)
+            if s not in self._disease_uris:
                 continue
-            seen_uris.add(s)
-            
-            # Get all labels for this disease
-            disease_labels = [str(o) for _, _, o in self.graph.triples((s, RDFS.label, None))]
+            self._label_to_uri.setdefault(label_lower, s)
+            self._base_label_to_uri.setdefault(label_lower.partition("(")[0].strip(), s)
+            self._disease_label_list.append((label_lower, s))
+
+        # Display label per disease, preferring labels without parentheses
+        # (shorter, more common names)
+        self._uri_to_labels: Dict[URIRef, List[str]] = {}
+        display_labels = set()
+        for s in self._disease_uris:
+            disease_labels = [str(o) for o in self._spo.get(s, {}).get(RDFS.label, ())]
+            self._uri_to_labels[s] = disease_labels
             if disease_labels:
-                # Prefer labels without parentheses (shorter, more common names)
                 labels_without_parens = [lbl for lbl in disease_labels if "(" not in lbl]
-                if labels_without_parens:
-                    labels.append(labels_without_parens[0])
-                else:
-                    labels.append(disease_labels[0])
-        
-        return sorted(set(labels))  # Remove duplicates and sort
+                display_labels.add(labels_without_parens[0] if labels_without_parens else disease_labels[0])
+        self._disease_display_labels = sorted(display_labels)
+
+    def _norm(self, s: str) -> str:
+        """Lowercased, stripped form of s; precomputed for every label in the graph."""
+        return self._norm_cache.get(s) or s.lower().strip()
+
+    def get_all_disease_labels(self) -> List[str]:
+        """Get all disease labels from the RDF graph, preferring shorter names."""
+        return list(self._disease_display_labels)
 
     def get_disease_uri_by_label(self, label: str) -> URIRef | None:
         """Find disease URI by label with flexible matching."""
-        label_lower = label.lower().strip()
-        
-        def is_disease(uri: URIRef) -> bool:
-            """Check if URI is a Disease type."""
-            return (uri, RDF.type, WHEAT.Disease) in self.graph
-        
+        label_lower = self._norm(label)
+
         # First, try exact match with type verification
-        for s, p, o in self.graph.triples((None, RDFS.label, None)):
-            if str(o).lower().strip() == label_lower:
-                if is_disease(s):
-                    return s
-        
+        uri = self._label_to_uri.get(label_lower)
+        if uri is not None:
+            return uri
+
         # Also try matching without parentheses content
         # e.g., "Stripe Rust (Yellow Rust)" should match "Stripe Rust"
-        label_base = label_lower.split("(")[0].strip()
+        label_base = label_lower.partition("(")[0].strip()
         if label_base and label_base != label_lower:
-            for s, p, o in self.graph.triples((None, RDFS.label, None)):
-                if not is_disease(s):
-                    continue
-                disease_label = str(o).lower().strip()
-                disease_label_base = disease_label.split("(")[0].strip()
-                if disease_label_base == label_base:
-                    return s
-        
+            uri = self._base_label_to_uri.get(label_base)
+            if uri is not None:
+                return uri
+
         # If no exact match, try partial matching
         # Check if label contains or is contained in any disease label
         best_match = None
         best_score = 0
-        
-        for s, p, o in self.graph.triples((None, RDFS.label, None)):
-            if not is_disease(s):
-                continue
-                
-            disease_label = str(o).lower().strip()
-            
+
+        for disease_label, s in self._disease_label_list:
             # Check if one contains the other (for cases like "Leaf Rust" matching "Leaf Rust (Brown Rust)")
             if label_lower in disease_label or disease_label in label_lower:
-                # Prefer exact matches or shorter labels
-                if disease_label == label_lower:
-                    return s
                 # Prefer when the search label is contained in disease label (more specific match)
                 if label_lower in disease_label:
                     score = len(label_lower)
@@ -108,77 +242,55 @@ class WheatKnowledgeBase:
                 if score > best_score:
                     best_score = score
                     best_match = s
-        
+
         # Fallback: if no type-checked match, try without type check (for robustness)
         if best_match is None:
-            for s, p, o in self.graph.triples((None, RDFS.label, None)):
-                if str(o).lower().strip() == label_lower:
-                    return s
-        
+            return self._any_label_to_uri.get(label_lower)
+
         return best_match
 
     def get_disease_facts(self, disease_label: str) -> DiseaseFacts | None:
+        # The graph is read-only after load, so memoize per normalized label
+        key = self._norm(disease_label)
+        if key in self._facts_cache:
+            return self._facts_cache[key]
+        facts = self._lookup_disease_facts(disease_label)
+        self._facts_cache[key] = facts
+        if facts is not None:
+            self._facts_dict_cache[id(facts)] = (facts, self._facts_to_dict(facts))
+        return facts
+
+    def _lookup_disease_facts(self, disease_label: str) -> DiseaseFacts | None:
         uri = self.get_disease_uri_by_label(disease_label)
         if uri is None:
             return None
 
-        g = self.graph
-        pathogen = None
-        symptoms: List[str] = []
-        treatments: List[str] = []
-        conditions: List[str] = []
-        plant_parts: List[str] = []
-        hosts: List[str] = []
-        notes: List[str] = []
-
-        # Pathogen
-        for _, _, pathogen_uri in g.triples((uri, WHEAT.causedBy, None)):
-            lab = g.value(pathogen_uri, RDFS.label)
-            if lab:
-                pathogen = str(lab)
-
-        # Symptoms
-        for _, _, sym_uri in g.triples((uri, WHEAT.hasSymptom, None)):
-            lab = g.value(sym_uri, RDFS.label)
-            if lab:
-                symptoms.append(str(lab))
-
-        # Treatments
-        for _, _, tr_uri in g.triples((uri, WHEAT.hasTreatment, None)):
-            lab = g.value(tr_uri, RDFS.label)
-            if lab:
-                treatments.append(str(lab))
-
-        # Conditions
-        for _, _, cond_uri in g.triples((uri, WHEAT.developsUnder, None)):
-            lab = g.value(cond_uri, RDFS.label)
-            if lab:
-                conditions.append(str(lab))
-
-        # Plant parts
-        for _, _, part_uri in g.triples((uri, WHEAT.affectsPlantPart, None)):
-            lab = g.value(part_uri, RDFS.label)
-            if lab:
-                plant_parts.append(str(lab))
-
-        # Hosts
-        for _, _, host_uri in g.triples((uri, WHEAT.affectsHost, None)):
-            lab = g.value(host_uri, RDFS.label)
-            if lab:
-                hosts.append(str(lab))
+        # Plain dict lookups on the load-time index instead of rdflib queries
+        po = self._spo.get(uri, {})
+        labels = self._labels
 
+        def object_labels(pred: URIRef) -> List[str]:
+            """Labels of the objects of `pred`, skipping unlabelled ones."""
+            return [str(lab) for obj in po.get(pred, ()) if (lab := labels.get(obj))]
+
+        pathogens = object_labels(WHEAT.causedBy)
+        pathogen = pathogens[-1] if pathogens else None
+        symptoms = object_labels(WHEAT.hasSymptom)
+        treatments = object_labels(WHEAT.hasTreatment)
+        conditions = object_labels(WHEAT.developsUnder)
+        plant_parts = object_labels(WHEAT.affectsPlantPart)
+        hosts = object_labels(WHEAT.affectsHost)
         # Notes (optional)
-        for _, _, note_lit in g.triples((uri, WHEAT.hasNote, None)):
-            notes.append(str(note_lit))
+        notes = [str(note_lit) for note_lit in po.get(WHEAT.hasNote, ())]
 
         # Get the most appropriate label
-        all_labels = [str(o) for _, _, o in g.triples((uri, RDFS.label, None))]
+        all_labels = [str(o) for o in po.get(RDFS.label, ())]
         if all_labels:
             # Prefer the label that matches the input disease_label (if provided)
             if disease_label:
-                disease_label_lower = disease_label.lower().strip()
+                disease_label_lower = self._norm(disease_label)
                 for lbl in all_labels:
-                    if lbl.lower().strip() == disease_label_lower:
+                    if self._norm(lbl) == disease_label_lower:
                         label = lbl
                         break
                 else:
@@ -214,6 +326,14 @@ class WheatKnowledgeBase:
     def to_dict(self, facts: DiseaseFacts | None) -> Dict[str, Any]:
         if facts is None:
             return {}
+        # Facts from get_disease_facts are never modified, so reuse their prebuilt dict
+        cached = self._facts_dict_cache.get(id(facts))
+        if cached is not None and cached[0] is facts:
+            return dict(cached[1])
+        return self._facts_to_dict(facts)
+
+    @staticmethod
+    def _facts_to_dict(facts: DiseaseFacts) -> Dict[str, Any]:
         return {
             "disease_uri": str(facts.uri),
             "disease_name": facts.label,
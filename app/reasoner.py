@@ -40,11 +40,11 @@ class WheatReasoner:
         # Symptom cross-check (very simple)
         if text_symptoms and facts_obj is not None:
             matched = []
+            ts_lowers = [ts.lower() for ts in text_symptoms]
             for sym in facts_obj.symptoms:
-                for ts in text_symptoms:
-                    if ts.lower() in sym.lower() or sym.lower() in ts.lower():
-                        matched.append(sym)
-                        break
+                sl = sym.lower()
+                if any(ts in sl or sl in ts for ts in ts_lowers):
+                    matched.append(sym)
             if matched:
                 symptom_evidence = matched
                 explanation_trace.append(
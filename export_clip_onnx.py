@@ -0,0 +1,50 @@
+"""
+Script to export the CLIP image encoder to ONNX.
+Writes app/models/clip_vision.onnx, which WheatDiseaseCLIP loads through ONNX Runtime when present.
+Text prompts are encoded once at startup, so only the image encoder is exported.
+"""
+
+from pathlib import Path
+
+import torch
+from transformers import CLIPModel
+
+# Must match the model used by WheatDiseaseCLIP
+MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# File paths
+ONNX_FILE = Path("app/models/clip_vision.onnx")
+
+
+class ImageEncoder(torch.nn.Module):
+    """Vision tower plus projection, i.e. CLIPModel.get_image_features."""
+
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+def export_clip_onnx():
+    """Export the FP32 image encoder with a dynamic batch dimension."""
+    model = CLIPModel.from_pretrained(MODEL_NAME).eval()
+    encoder = ImageEncoder(model)
+    dummy_pixel_values = torch.randn(1, 3, 224, 224)
+
+    ONNX_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            encoder,
+            (dummy_pixel_values,),
+            str(ONNX_FILE),
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "B"}, "image_embeds": {0: "B"}},
+            opset_version=17,
+        )
+    print(f"Exported CLIP image encoder to {ONNX_FILE}")
+
+if __name__ == "__main__":
+    export_clip_onnx()
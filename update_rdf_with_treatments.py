@@ -1,10 +1,13 @@
 """
 Script to update RDF knowledge base with treatments from CSV file.
-Reads treatments from csv_with_disease_specific_treatments.csv and adds them to cimmyt_wheat_diseases.ttl
+Reads treatments from csv_with_disease_specific_treatments.csv and appends the new ones to
+cimmyt_wheat_diseases.additions.nt, which the app loads together with cimmyt_wheat_diseases.ttl
 """
 
 import csv
+from collections import defaultdict
 from pathlib import Path
+from typing import List, Tuple
 from rdflib import Graph, Namespace, RDF, RDFS, Literal, URIRef
 
 # Namespace
@@ -13,6 +16,11 @@ WHEAT = Namespace("http://example.org/wheat#")
 # File paths
 CSV_FILE = Path("app/data/csv_with_disease_specific_treatments.csv")
 RDF_FILE = Path("app/rdf/cimmyt_wheat_diseases.ttl")
+# New triples are appended here as N-Triples; the app loads it alongside RDF_FILE
+ADDITIONS_FILE = RDF_FILE.with_suffix(".additions.nt")
+
+# Treatment delimiters in priority order: a row is split on the first one it contains
+TREATMENT_DELIMITERS = (';', '\n', '|', '•')
 
 def normalize_disease_name(name: str) -> str:
     """Normalize disease name to match RDF naming convention."""
@@ -26,40 +34,51 @@ def normalize_disease_name(name: str) -> str:
     name = name.strip("_")
     return name
 
-def get_disease_uri_from_label(graph: Graph, disease_label: str) -> URIRef | None:
-    """Find disease URI by label."""
+def build_disease_label_index(graph: Graph) -> List[Tuple[str, str, URIRef]]:
+    """Lowercased label, its base without parentheses, and URI for every Disease label."""
+    disease_uris = frozenset(graph.subjects(RDF.type, WHEAT.Disease))
+    index = []
+    for s, p, o in graph.triples((None, RDFS.label, None)):
+        if s in disease_uris:
+            label_lower = str(o).lower().strip()
+            index.append((label_lower, label_lower.partition("(")[0].strip(), s))
+    return index
+
+def get_disease_uri_from_label(
+    graph: Graph, disease_label: str, label_index: List[Tuple[str, str, URIRef]] | None = None
+) -> URIRef | None:
+    """Find disease URI by label.
+
+    Pass a prebuilt `label_index` (see build_disease_label_index) when looking up many labels.
+    """
+    if label_index is None:
+        label_index = build_disease_label_index(graph)
     disease_label_lower = disease_label.lower().strip()
     
     # Try exact match first
-    for s, p, o in graph.triples((None, RDFS.label, None)):
-        if str(o).lower().strip() == disease_label_lower:
-            if (s, RDF.type, WHEAT.Disease) in graph:
-                return s
+    for disease_label_str, _, s in label_index:
+        if disease_label_str == disease_label_lower:
+            return s
     
     # Try matching without parentheses
-    label_base = disease_label_lower.split("(")[0].strip()
+    label_base = disease_label_lower.partition("(")[0].strip()
     if label_base and label_base != disease_label_lower:
-        for s, p, o in graph.triples((None, RDFS.label, None)):
-            if (s, RDF.type, WHEAT.Disease) in graph:
-                disease_label_str = str(o).lower().strip()
-                disease_label_base = disease_label_str.split("(")[0].strip()
-                if disease_label_base == label_base:
-                    return s
+        for _, disease_label_base, s in label_index:
+            if disease_label_base == label_base:
+                return s
     
     # Try partial matching
     best_match = None
     best_score = 0
     
-    for s, p, o in graph.triples((None, RDFS.label, None)):
-        if (s, RDF.type, WHEAT.Disease) in graph:
-            disease_label_str = str(o).lower().strip()
-            if disease_label_lower in disease_label_str or disease_label_str in disease_label_lower:
-                if disease_label_str == disease_label_lower:
-                    return s
-                score = len(disease_label_lower) if disease_label_lower in disease_label_str else len(disease_label_str)
-                if score > best_score:
-                    best_score = score
-                    best_match = s
+    for disease_label_str, _, s in label_index:
+        if disease_label_lower in disease_label_str or disease_label_str in disease_label_lower:
+            if disease_label_str == disease_label_lower:
+                return s
+            score = len(disease_label_lower) if disease_label_lower in disease_label_str else len(disease_label_str)
+            if score > best_score:
+                best_score = score
+                best_match = s
     
     return best_match
 
@@ -72,6 +91,8 @@ def add_treatments_to_rdf():
         return
     
     graph.parse(RDF_FILE, format="turtle")
+    if ADDITIONS_FILE.exists():
+        graph.parse(ADDITIONS_FILE, format="nt")
     print(f"Loaded RDF graph with {len(graph)} triples")
     
     # Read CSV
@@ -79,9 +100,25 @@ def add_treatments_to_rdf():
         print(f"Error: CSV file not found at {CSV_FILE}")
         return
     
+    label_index = build_disease_label_index(graph)
+
+    # Existing treatment labels per disease, collected once for duplicate checks.
+    # A treatment node can carry several labels, so take all of them.
+    existing_treatments: defaultdict[URIRef, set[str]] = defaultdict(set)
+    for disease_uri, _, tr_uri in graph.triples((None, WHEAT.hasTreatment, None)):
+        for existing_label in graph.objects(tr_uri, RDFS.label):
+            existing_treatments[disease_uri].add(str(existing_label).strip())
+
+    # Only the new triples are written out; collect them as quads for one bulk insert
+    additions = Graph()
+    new_quads = []
     treatments_added = 0
     diseases_with_treatments = 0
     diseases_not_found = []
+
+    # Constant terms bound once rather than looked up per treatment
+    rdf_type, rdfs_label = RDF.type, RDFS.label
+    treatment_cls, has_treatment = WHEAT.Treatment, WHEAT.hasTreatment
     
     with open(CSV_FILE, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
@@ -98,7 +135,7 @@ def add_treatments_to_rdf():
             diseases_with_treatments += 1
             
             # Find disease URI in RDF
-            disease_uri = get_disease_uri_from_label(graph, disease_name)
+            disease_uri = get_disease_uri_from_label(graph, disease_name, label_index)
             
             if disease_uri is None:
                 diseases_not_found.append(disease_name)
@@ -107,48 +144,47 @@ def add_treatments_to_rdf():
             
             # Parse treatments (assuming they might be separated by semicolons or newlines)
             # Split by common delimiters
+            delimiter = next((d for d in TREATMENT_DELIMITERS if d in treatments_str), None)
             treatment_list = []
-            for delimiter in [';', '\n', '|', '•']:
-                if delimiter in treatments_str:
-                    treatment_list = [t.strip() for t in treatments_str.split(delimiter) if t.strip()]
-                    break
+            if delimiter is not None:
+                treatment_list = [t for t in map(str.strip, treatments_str.split(delimiter)) if t]
             
             if not treatment_list:
                 # If no delimiter found, treat entire string as one treatment
                 treatment_list = [treatments_str]
             
             # Add each treatment to RDF
+            treatment_prefix = normalize_disease_name(disease_name) + "_Treatment_"
             for treatment_text in treatment_list:
                 if not treatment_text:
                     continue
                 
-                # Create treatment URI
-                treatment_id = normalize_disease_name(disease_name) + "_Treatment_" + str(treatments_added + 1)
-                treatment_uri = WHEAT[treatment_id]
-                
                 # Check if treatment already exists (avoid duplicates)
-                existing = False
-                for _, _, tr_uri in graph.triples((disease_uri, WHEAT.hasTreatment, None)):
-                    existing_label = graph.value(tr_uri, RDFS.label)
-                    if existing_label and str(existing_label).strip() == treatment_text.strip():
-                        existing = True
-                        break
-                
-                if not existing:
+                if treatment_text.strip() not in existing_treatments[disease_uri]:
+                    # Create treatment URI (only for treatments that are added)
+                    treatment_id = treatment_prefix + str(treatments_added + 1)
+                    treatment_uri = WHEAT[treatment_id]
+                    
                     # Add treatment as a Treatment instance
-                    graph.add((treatment_uri, RDF.type, WHEAT.Treatment))
-                    graph.add((treatment_uri, RDFS.label, Literal(treatment_text)))
+                    new_quads.append((treatment_uri, rdf_type, treatment_cls, additions))
+                    new_quads.append((treatment_uri, rdfs_label, Literal(treatment_text), additions))
                     
                     # Link treatment to disease
-                    graph.add((disease_uri, WHEAT.hasTreatment, treatment_uri))
+                    new_quads.append((disease_uri, has_treatment, treatment_uri, additions))
+                    existing_treatments[disease_uri].add(treatment_text.strip())
                     
                     treatments_added += 1
                     print(f"Added treatment for {disease_name}: {treatment_text[:80]}")
     
-    # Save updated RDF
+    # Save updated RDF: append the new triples as N-Triples instead of
+    # re-serializing the whole graph with the (slow) Turtle serializer
     if treatments_added > 0:
-        graph.serialize(destination=RDF_FILE, format="turtle")
-        print(f"\nSuccessfully added {treatments_added} treatments to RDF file")
+        # An append-only file is not a set: skip triples the graph already has
+        # (e.g. rdf:type of a treatment node that received another label)
+        additions.addN(q for q in new_quads if q[:3] not in graph)
+        with open(ADDITIONS_FILE, "a", encoding="utf-8") as f:
+            f.write(additions.serialize(format="nt"))
+        print(f"\nSuccessfully added {treatments_added} treatments to {ADDITIONS_FILE}")
         print(f"Updated {diseases_with_treatments} diseases with treatments")
     else:
         print(f"\nWarning: No treatments found in CSV file to add")